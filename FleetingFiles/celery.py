@@ -30,4 +30,10 @@ def debug_task(self):
     print(f"Request: {self.request!r}")
 
 
-# celery -A FleetingFiles.celery worker --pool=solo  -l info
+# Room expiry runs on its own queue; tasks are idempotent and safe under prefork, threads or gevent.
+# The "celery" worker also runs the expiries queued by deployments from before the expiry queue, so
+# keep it running until `celery -A FleetingFiles.celery inspect scheduled` shows none of them left.
+# celery -A FleetingFiles.celery worker -Q expiry --concurrency=4 -n expiry@%h -l info
+# celery -A FleetingFiles.celery worker -Q celery -n celery@%h -l info
+# celery -A FleetingFiles.celery worker -Q maintenance --concurrency=1 -n maintenance@%h -l info
+# celery -A FleetingFiles.celery beat -l info
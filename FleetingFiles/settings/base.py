@@ -36,6 +36,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",  # must sit directly after SecurityMiddleware
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -74,6 +75,12 @@ DATABASES = {
     }
 }
 
+# Rooms and their files are spread over these databases by room.routers.RoomShardRouter. After
+# adding a shard, migrate it and run "python manage.py rebalance_rooms".
+ROOM_SHARDS = ["default"]
+
+DATABASE_ROUTERS = ["room.routers.RoomShardRouter"]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -120,3 +127,26 @@ CELERY_RESULT_SERIALIZER = "json"
 # CELERY_TIMEZONE = "Asia/Kolkata"
 CELERY_TASK_ACKS_LATE = True
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Room expiry gets its own queue (and its own workers) so other background jobs cannot starve it.
+# Other tasks stay on Celery's default "celery" queue, which also still holds expiries that were
+# scheduled with an ETA before the expiry queue existed.
+CELERY_TASK_ROUTES = {
+    "room.views.delete_room": {"queue": "expiry"},
+    "room.tasks.reconcile_storage": {"queue": "maintenance"},
+}
+CELERY_BEAT_SCHEDULE = {
+    "reconcile-storage": {
+        "task": "room.tasks.reconcile_storage",
+        "schedule": 60 * 60,  # every hour
+    },
+}
+
+# Bucket reconciliation, see room.reconcile. Every scheduled run handles at most RECONCILE_MAX_KEYS
+# objects and rows, at RECONCILE_RATE per second, and resumes from where the previous run stopped.
+# Orphans are only logged unless RECONCILE_DELETE is set.
+RECONCILE_DELETE = False
+RECONCILE_MAX_KEYS = 100000
+RECONCILE_RATE = 200
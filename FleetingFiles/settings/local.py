@@ -8,6 +8,14 @@ DEBUG = True
 
 ALLOWED_HOSTS = ["127.0.0.1"]
 
+# Set room_shards (e.g. room_shards=4) to spread rooms over several SQLite files.
+for shard in range(1, int(os.getenv("room_shards", "1"))):
+    DATABASES[f"shard_{shard}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / f"db_shard_{shard}.sqlite3",
+    }
+    ROOM_SHARDS.append(f"shard_{shard}")
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
@@ -24,11 +32,15 @@ AWS_STORAGE_BUCKET_NAME = os.getenv("bucket_name")
 AWS_S3_CUSTOM_DOMAIN = "myBucket.s3.amazonaws.com"
 AWS_S3_FILE_OVERWRITE = False
 
-# Boto3 storage configuration
-DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
-
+# CloudFront distribution in front of the bucket. When all three are set, downloads are redirected
+# to signed CloudFront URLs instead of presigned S3 URLs.
+CLOUDFRONT_DOMAIN = os.getenv("cloudfront_domain")
+CLOUDFRONT_KEY_ID = os.getenv("cloudfront_key_id")
+CLOUDFRONT_PRIVATE_KEY_PATH = os.getenv("cloudfront_private_key_path")
+CLOUDFRONT_URL_EXPIRY = 60  # seconds
 
-STORAGE = {
+# Storage configuration: media files on S3, static files hashed and precompressed by whitenoise
+STORAGES = {
     # Media File management
     "default": {
         "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
@@ -43,7 +55,6 @@ STATIC_URL = "/staticfiles/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "FleetingFiles/static"),
-    os.path.join(BASE_DIR, "room/static"),
 ]
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
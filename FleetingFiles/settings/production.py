@@ -11,10 +11,6 @@ ALLOWED_HOSTS = []
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
 
-MIDDLEWARE += [
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # whitenoise configuration
-]
-
 # Aws configuration
 
 AWS_ACCESS_KEY_ID = os.getenv("access_key")
@@ -25,23 +21,30 @@ AWS_STORAGE_BUCKET_NAME = os.getenv("bucket_name")
 AWS_S3_CUSTOM_DOMAIN = "myBucket.s3.amazonaws.com"
 AWS_S3_FILE_OVERWRITE = False
 
-# Boto3 storage configuration
-DEFAULT_FILE_STORAGE = "storages.backends.s3boto3.S3Boto3Storage"
+# CloudFront distribution in front of the bucket. When all three are set, downloads are redirected
+# to signed CloudFront URLs instead of presigned S3 URLs.
+CLOUDFRONT_DOMAIN = os.getenv("cloudfront_domain")
+CLOUDFRONT_KEY_ID = os.getenv("cloudfront_key_id")
+CLOUDFRONT_PRIVATE_KEY_PATH = os.getenv("cloudfront_private_key_path")
+CLOUDFRONT_URL_EXPIRY = 60  # seconds
 
-
-STORAGE = {
+# Storage configuration: media files on S3, static files hashed and precompressed by whitenoise
+STORAGES = {
     # Media File management
     "default": {
         "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
     },
     # Static file management
     "staticfiles": {
-        "BACKEND": "storages.backends.s3boto3.S3StaticStorage",
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
 }
 
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+STATICFILES_DIRS = [
+    os.path.join(BASE_DIR, "FleetingFiles/static"),
+]
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 MEDIAFILES_LOCATION = "media"
@@ -0,0 +1,51 @@
+"""Test settings and globals."""
+
+import tempfile
+
+from .base import *
+
+SECRET_KEY = "test"
+
+DEBUG = False
+
+ALLOWED_HOSTS = ["testserver"]
+
+# Three room shards, so the tests go through room.routers.RoomShardRouter. The test runner creates
+# a separate in-memory database for each of them.
+DATABASES = {
+    alias: {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / f"test_{alias}.sqlite3",
+    }
+    for alias in ["default", "shard_1", "shard_2"]
+}
+ROOM_SHARDS = ["default", "shard_1", "shard_2"]
+
+# Aws configuration, S3 calls are mocked in the tests
+AWS_ACCESS_KEY_ID = "test"
+AWS_SECRET_ACCESS_KEY = "test"
+AWS_STORAGE_BUCKET_NAME = "test"
+
+CLOUDFRONT_DOMAIN = None
+CLOUDFRONT_KEY_ID = None
+CLOUDFRONT_PRIVATE_KEY_PATH = None
+CLOUDFRONT_URL_EXPIRY = 60
+
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": tempfile.mkdtemp()},
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+STATIC_URL = "/static/"
+STATICFILES_DIRS = [
+    os.path.join(BASE_DIR, "FleetingFiles/static"),
+]
+MEDIA_URL = "/media/"
+
+# Never talk to the broker from the tests.
+CELERY_TASK_ALWAYS_EAGER = True
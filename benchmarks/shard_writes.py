@@ -0,0 +1,75 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+"""
+Benchmark of concurrent room creation against a growing number of SQLite room shards.
+
+Every thread creates rooms with two files each, the way create_room and upload do, so the numbers
+show how much write throughput sharding buys when writers would otherwise queue on one database
+file. The databases are created in a temporary directory and removed afterwards.
+
+Usage (from the repository root):
+  python benchmarks/shard_writes.py 1 2 4 8
+
+"""
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent room creation over room shards.")
+    parser.add_argument("shards", type=int, nargs="+", help="Numbers of shards to benchmark.")
+    parser.add_argument("--rooms", type=int, default=1600, help="Rooms created per run.")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent writers.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("django_secret_key", "benchmark")
+    # Settings are loaded once, so configure the largest run and narrow ROOM_SHARDS per run.
+    os.environ.update(DJANGO_SETTINGS_MODULE="FleetingFiles.settings.local", room_shards=str(max(args.shards)))
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+
+    from django.core.management import call_command
+    from django.db import connections
+    from django.test.utils import override_settings
+
+    from room.models import File, Room
+    from room.routers import shard_for_room
+
+    def create_rooms(offset):
+        for i in range(offset, args.rooms, args.threads):
+            rname = f"room{i}"
+            room = Room.objects.using(shard_for_room(rname)).create(rname=rname, rpass="pass")
+            File.objects.using(room._state.db).bulk_create([File(room=room, file=f"{rname}_{k}.pdf") for k in range(2)])
+        connections.close_all()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for shards in args.shards:
+            for alias in settings.DATABASES:
+                settings.DATABASES[alias]["NAME"] = Path(tmp) / f"{shards}_{alias}.sqlite3"
+            connections.close_all()
+            with override_settings(ROOM_SHARDS=settings.ROOM_SHARDS[:shards]):
+                for alias in settings.ROOM_SHARDS:
+                    call_command("migrate", database=alias, verbosity=0)
+
+                started = time.perf_counter()
+                threads = [threading.Thread(target=create_rooms, args=(offset,)) for offset in range(args.threads)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+            print(f"shards={shards} rooms/s={args.rooms / elapsed:.0f} commits/s={2 * args.rooms / elapsed:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+"""
+Benchmark of signing download URLs with CloudFront against presigning them with S3.
+
+Both are computed locally, without an AWS call: a CloudFront URL costs an RSA signature with the
+key pair's private key, a presigned S3 URL an HMAC. A throwaway RSA key and dummy credentials are
+used, so nothing has to be configured.
+
+Usage (from the repository root):
+  python benchmarks/sign_urls.py --urls 5000
+
+"""
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CloudFront signed URLs against S3 presigned URLs.")
+    parser.add_argument("--urls", type=int, default=5000, help="URLs signed per method.")
+    args = parser.parse_args()
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    with tempfile.TemporaryDirectory() as tmp:
+        key_path = Path(tmp) / "cloudfront.pem"
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        key_path.write_bytes(
+            private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            )
+        )
+
+        sys.path.insert(0, str(BASE_DIR))
+        os.environ.setdefault("django_secret_key", "benchmark")
+        os.environ.update(
+            DJANGO_SETTINGS_MODULE="FleetingFiles.settings.local",
+            cloudfront_domain="d111111abcdef8.cloudfront.net",
+            cloudfront_key_id="K2JCJMDEHXQW5F",
+            cloudfront_private_key_path=str(key_path),
+            access_key="AKIAEXAMPLE",
+            secret_key="benchmark",
+            bucket_name="benchmark",
+        )
+
+        import django
+
+        django.setup()
+
+        from room.cdn import generate_cloudfront_url
+        from room.views import generate_presigned_url
+
+        for name, sign in [("cloudfront", generate_cloudfront_url), ("s3 presign", generate_presigned_url)]:
+            sign("warm_up.pdf")  # Loads the key and builds the client outside the timing.
+            elapsed = timeit.timeit(lambda: sign("lecture_notes_week_3.pdf"), number=args.urls)
+            print(f"{name}: {elapsed / args.urls * 1e6:.0f} us/url, {args.urls / elapsed:.0f} urls/s")
+
+
+if __name__ == "__main__":
+    main()
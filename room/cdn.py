@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from urllib.parse import quote, urlencode
+
+import pytz
+from botocore.signers import CloudFrontSigner
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from django.conf import settings
+
+"""
+CloudFront helpers for the room app.
+
+Downloads can be served through a CloudFront distribution in front of the bucket, so that a file
+downloaded by a whole room is fetched from S3 once and then served from the edge. URLs are signed
+locally with the private key of a CloudFront key pair; no AWS call is made per download.
+
+Functions:
+- cloudfront_enabled: Check whether CloudFront downloads are configured.
+- get_cloudfront_signer: Get a signer for the configured key pair.
+- generate_cloudfront_url: Generate a signed CloudFront URL for a file.
+
+"""
+
+
+def cloudfront_enabled():
+    """
+    Check whether downloads should go through CloudFront instead of presigned S3 URLs.
+
+    Returns:
+        bool: True if a distribution domain, key pair id and private key are all configured.
+    """
+
+    return bool(settings.CLOUDFRONT_DOMAIN and settings.CLOUDFRONT_KEY_ID and settings.CLOUDFRONT_PRIVATE_KEY_PATH)
+
+
+@lru_cache(maxsize=None)
+def get_cloudfront_signer():
+    """
+    Get a signer for the configured CloudFront key pair.
+
+    The private key is read and parsed once per process; signing itself is thread-safe.
+
+    Returns:
+        botocore.signers.CloudFrontSigner: The signer.
+    """
+
+    with open(settings.CLOUDFRONT_PRIVATE_KEY_PATH, "rb") as key_file:
+        private_key = serialization.load_pem_private_key(key_file.read(), password=None)
+
+    def rsa_signer(message):
+        return private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+    return CloudFrontSigner(settings.CLOUDFRONT_KEY_ID, rsa_signer)
+
+
+def generate_cloudfront_url(object_name):
+    """
+    Generate a signed CloudFront URL for a file to download. The URL expires after
+    CLOUDFRONT_URL_EXPIRY seconds.
+
+    The signature only covers this one object, which belongs to exactly one room. The distribution's
+    cache policy should key on the response-content-* query strings only: they are the same for
+    every download of a file, so all signed URLs for it hit the same cached copy, and the edge
+    answers Range requests from that copy, which lets downloads resume.
+
+    Args:
+        object_name (str): The name of the file.
+
+    Returns:
+        str: The signed URL.
+    """
+
+    query = urlencode(
+        {
+            "response-content-type": "application/octet-stream",
+            "response-content-disposition": f'attachment; filename="{object_name}"',
+        }
+    )
+    url = f"https://{settings.CLOUDFRONT_DOMAIN}/{quote(object_name)}?{query}"
+    return get_cloudfront_signer().generate_presigned_url(
+        url,
+        date_less_than=datetime.now(pytz.timezone("UTC")) + timedelta(seconds=settings.CLOUDFRONT_URL_EXPIRY),
+    )
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from room.models import File, Room
+from room.routers import shard_for_room
+
+"""
+Management command to move rooms onto the shard their name maps to.
+
+Run it after adding or removing a database in settings.ROOM_SHARDS (and migrating the new ones).
+Each room is copied together with its files inside one transaction per database, then deleted from
+the old shard. Until then the views and the expiry task find rooms on their old shard through
+room.routers.find_room, as long as that database is still listed in ROOM_SHARDS; rooms on a database
+removed from it are unreachable until they are moved with --from-shard.
+
+Classes:
+- RoomChanged: Raised when files are added to a room while it is being moved.
+- Command: The rebalance_rooms management command.
+
+"""
+
+
+class RoomChanged(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Move rooms and their files onto the shard chosen by room.routers.shard_for_room."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the rooms that would move.",
+        )
+        parser.add_argument(
+            "--from-shard",
+            action="append",
+            dest="from_shards",
+            help="Also drain this database alias, e.g. one that was removed from ROOM_SHARDS.",
+        )
+
+    def handle(self, *args, **options):
+        moved = skipped = 0
+        for source in [*settings.ROOM_SHARDS, *(options["from_shards"] or [])]:
+            # Collect the names first, rows are deleted from the source as rooms move.
+            rnames = [
+                rname
+                for rname in Room.objects.using(source).values_list("rname", flat=True).iterator()
+                if shard_for_room(rname) != source
+            ]
+            for rname in rnames:
+                target = shard_for_room(rname)
+                if options["dry_run"]:
+                    self.stdout.write(f"{rname}: {source} -> {target}")
+                    moved += 1
+                    continue
+                try:
+                    room_moved = self.move_room(rname, source, target)
+                except RoomChanged:
+                    self.stderr.write(f"{rname}: files were added while moving, left on {source}, run again")
+                    skipped += 1
+                    continue
+                if room_moved:
+                    moved += 1
+                else:
+                    self.stderr.write(f"{rname}: already exists on {target}, left on {source}")
+                    skipped += 1
+        self.stdout.write(self.style.SUCCESS(f"{moved} rooms moved, {skipped} skipped"))
+
+    def move_room(self, rname, source, target):
+        """
+        Copy a room and its files from one database to another, then delete the original.
+
+        The room row is locked first, so on databases with row locks uploads into the room wait
+        until it has moved. Only the copied files are deleted from the source; if any others are
+        left (e.g. on SQLite, which ignores the lock) nothing is moved, so no file row is lost.
+
+        Returns:
+            bool: False if a room with the same name already exists on the target.
+
+        Raises:
+            RoomChanged: If files were added to the room while it was being copied.
+        """
+        with transaction.atomic(using=source), transaction.atomic(using=target):
+            if Room.objects.using(target).filter(rname=rname).exists():
+                return False
+            room = Room.objects.using(source).select_for_update().get(rname=rname)
+            files = list(room.file_set.all())
+            copy = Room.objects.using(target).create(
+                rname=room.rname,
+                rpass=room.rpass,
+                expires_at=room.expires_at,
+                expiry_claimed_at=room.expiry_claimed_at,
+            )
+            for file_obj in files:
+                file_copy = File.objects.using(target).create(room=copy, file=file_obj.file.name)
+                # uploaded_at is auto_now_add, so the original timestamp has to be written back.
+                File.objects.using(target).filter(pk=file_copy.pk).update(uploaded_at=file_obj.uploaded_at)
+            room.file_set.filter(pk__in=[file_obj.pk for file_obj in files]).delete()
+            if room.file_set.exists():
+                # Rolls back the copy on the target as well.
+                raise RoomChanged(rname)
+            room.delete()
+        return True
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from room.reconcile import DEFAULT_CHECKPOINT, load_checkpoint, reconcile_storage, save_checkpoint
+
+"""
+Management command to reconcile the S3 bucket against the File table, see room.reconcile.
+
+Classes:
+- Command: The reconcile_storage management command.
+
+"""
+
+
+class Command(BaseCommand):
+    help = "Report, and optionally delete, bucket objects without a File row and File rows without an object."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete the orphans instead of only reporting them.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue from the checkpoint left by a previous run, and update it.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=DEFAULT_CHECKPOINT,
+            help=(
+                "Name of the checkpoint to resume from and to update. Defaults to the one the scheduled "
+                "task uses, which is only updated with --resume."
+            ),
+        )
+        parser.add_argument("--prefix", default="", help="Only reconcile keys starting with this prefix.")
+        parser.add_argument("--max-keys", type=int, help="Stop after this many objects and rows.")
+        parser.add_argument(
+            "--rate",
+            type=float,
+            default=settings.RECONCILE_RATE,
+            help="Objects and rows processed per second, 0 for no limit. Defaults to RECONCILE_RATE.",
+        )
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=60,
+            help="Skip objects and rows younger than this, so uploads in progress are left alone.",
+        )
+
+    def handle(self, *args, **options):
+        # The default checkpoint is shared with the scheduled task, which reconciles the whole bucket.
+        shared = options["checkpoint"] == DEFAULT_CHECKPOINT
+        if options["prefix"] and shared:
+            raise CommandError("--prefix needs its own --checkpoint, the default one covers the whole bucket.")
+        save = options["resume"] or not shared
+
+        stats = reconcile_storage(
+            delete=options["delete"],
+            start_after=load_checkpoint(options["checkpoint"]) if options["resume"] else "",
+            prefix=options["prefix"],
+            max_keys=options["max_keys"],
+            rate=options["rate"] or None,
+            grace=timedelta(minutes=options["grace_minutes"]),
+            report=lambda kind, key: self.stdout.write(
+                f"orphaned object: {key}" if kind == "object" else f"missing object for row: {key}"
+            ),
+        )
+        if save:
+            save_checkpoint(stats["checkpoint"], options["checkpoint"])
+        action = "deleted" if options["delete"] else "found"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{stats['objects']} objects and {stats['rows']} rows checked, {action} "
+                f"{stats['orphaned_objects']} orphaned objects and {stats['missing_objects']} rows without an object"
+            )
+        )
+        if stats["checkpoint"] is None:
+            return
+        if save:
+            self.stdout.write(f"Stopped after {stats['checkpoint']!r}, run again with --resume to continue.")
+        else:
+            self.stdout.write(
+                f"Stopped after {stats['checkpoint']!r}. The checkpoint was left alone, use --checkpoint to "
+                "keep a resumable one of your own."
+            )
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-19 01:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('room', '0003_remove_file_name_alter_file_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='expiry_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
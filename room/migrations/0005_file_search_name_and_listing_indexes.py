@@ -0,0 +1,32 @@
+# Generated by Django 5.0.1 on 2026-10-19 01:57
+
+from django.db import migrations, models
+
+
+def fill_search_name(apps, schema_editor):
+    # room.models.search_key, inlined so later changes to it don't change this migration.
+    File = apps.get_model("room", "File")
+    files = File.objects.using(schema_editor.connection.alias)
+    for file_obj in files.only("pk", "file").iterator():
+        files.filter(pk=file_obj.pk).update(search_name=file_obj.file.name.lower())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('room', '0004_room_expiry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['room', 'uploaded_at', 'id'], name='room_file_room_id_4b5869_idx'),
+        ),
+    ]
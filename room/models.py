@@ -5,18 +5,65 @@ Models for the room app.
 
 This module defines the models for the room app, including the Room and File models.
 
+Functions:
+- search_key: Normalise a file name or query for searching.
+
 Classes:
 - Room: Represents a room with a name and password.
 - File: Represents a file uploaded to a room.
+- ReconcileCheckpoint: Where a run of room.reconcile.reconcile_storage stopped.
 
 """
 
 
+def search_key(name):
+    """
+    Normalise a file name, or a search query, for matching against File.search_name.
+
+    Lower-cases with Python's Unicode rules rather than the database's LOWER(), which on SQLite only
+    folds ASCII letters.
+
+    Args:
+        name (str): The file name or query.
+
+    Returns:
+        str: The lower-cased name.
+    """
+
+    return name.lower()
+
+
 class Room(models.Model):
     rname = models.CharField(max_length=30, unique=True)
     rpass = models.CharField(max_length=30)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    # Set by the expiry task while it is deleting the room, see room.tasks.delete_room.
+    expiry_claimed_at = models.DateTimeField(null=True, blank=True)
 
 class File(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     file = models.FileField()
-    uploaded_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+    # search_key of the file name, for searching the files of a room. Set by save(); bulk_create
+    # skips save(), so callers of it set it themselves. A substring search can't use a B-tree index,
+    # so it filters the room's files while they are read in page order from the
+    # (room, uploaded_at, id) index, see room.views.get_files_page.
+    search_name = models.CharField(max_length=100, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a room's files, see room.views.get_files_page.
+            models.Index(fields=["room", "uploaded_at", "id"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.search_name = search_key(self.file.name or "")
+        super().save(*args, **kwargs)
+
+
+class ReconcileCheckpoint(models.Model):
+    # Kept in the "default" database only (see room.routers.RoomShardRouter), so every worker and
+    # the reconcile_storage command resume from the same key.
+    name = models.CharField(max_length=50, unique=True)
+    start_after = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
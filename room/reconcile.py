@@ -0,0 +1,220 @@
+import heapq
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Collate
+from django.utils import timezone
+
+from .models import File, ReconcileCheckpoint
+from .s3 import S3_DELETE_BATCH, delete_s3_keys, get_s3_client
+
+"""
+Reconciliation of the S3 bucket against the File table.
+
+S3 lists keys in ascending UTF-8 byte order, so the bucket listing and the File rows of every shard
+(read in the same order) can be walked side by side like a merge join. Only one listing page and
+one batch of rows per shard is held in memory, however large the bucket is.
+
+Two kinds of orphans are found:
+- objects in the bucket that no File row points to (e.g. an upload that crashed before its row was
+  created, or a room whose objects failed to delete), and
+- File rows whose object is missing from the bucket.
+
+Objects and rows younger than the grace period are skipped, since an upload in progress writes the
+object before its row.
+
+Functions:
+- iter_bucket_objects: Stream the keys in the bucket.
+- iter_file_rows: Stream the File rows of one database.
+- reconcile_storage: Find, and optionally delete, orphans in both directions.
+- load_checkpoint: Read the key a previous run stopped at.
+- save_checkpoint: Store the key a run stopped at.
+
+Checkpoints are stored in the ReconcileCheckpoint table, so a run picked up by any worker resumes
+where the previous one stopped.
+
+"""
+
+# Collations that compare strings byte by byte, matching the order of the S3 listing.
+BINARY_COLLATIONS = {
+    "sqlite": "BINARY",
+    "postgresql": "C",
+    "mysql": "utf8mb4_bin",
+}
+
+# Name of the checkpoint shared by the scheduled task and the reconcile_storage command.
+DEFAULT_CHECKPOINT = "default"
+
+
+def iter_bucket_objects(start_after="", prefix="", page_size=1000):
+    """
+    Stream the keys in the bucket in listing order, one page at a time.
+
+    Args:
+        start_after (str): Only list keys after this one.
+        prefix (str): Only list keys starting with this prefix.
+        page_size (int): Number of keys fetched per request.
+
+    Yields:
+        tuple[str, datetime]: The key and last modification time of every object.
+    """
+
+    params = {"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Prefix": prefix}
+    if start_after:
+        params["StartAfter"] = start_after
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    for page in paginator.paginate(**params, PaginationConfig={"PageSize": page_size}):
+        for obj in page.get("Contents", []):
+            yield obj["Key"], obj["LastModified"]
+
+
+def iter_file_rows(alias, start_after="", prefix="", batch_size=1000):
+    """
+    Stream the File rows of one database ordered by file name, one batch at a time.
+
+    Batches are fetched by keyset pagination on the name, so rows deleted while streaming don't
+    shift the batches that follow.
+
+    Args:
+        alias (str): The database alias.
+        start_after (str): Only return names after this one.
+        prefix (str): Only return names starting with this prefix.
+        batch_size (int): Number of rows fetched per query.
+
+    Yields:
+        tuple[str, str, int, datetime]: The file name, database alias, primary key and upload time.
+    """
+
+    collation = BINARY_COLLATIONS.get(connections[alias].vendor)
+    rows = File.objects.using(alias).annotate(key=Collate("file", collation) if collation else F("file"))
+    if prefix:
+        rows = rows.filter(key__startswith=prefix)
+    rows = rows.order_by("key").values_list("key", "pk", "uploaded_at")
+    while True:
+        batch = list(rows.filter(key__gt=start_after)[:batch_size])
+        for name, pk, uploaded_at in batch:
+            yield name, alias, pk, uploaded_at
+        if len(batch) < batch_size:
+            return
+        start_after = batch[-1][0]
+
+
+def reconcile_storage(
+    delete=False,
+    start_after="",
+    prefix="",
+    max_keys=None,
+    rate=None,
+    grace=timedelta(hours=1),
+    batch_size=1000,
+    report=None,
+):
+    """
+    Find, and optionally delete, orphaned objects and rows.
+
+    Args:
+        delete (bool): Delete the orphans instead of only reporting them.
+        start_after (str): Resume after this key, as returned by a previous run.
+        prefix (str): Only reconcile keys starting with this prefix.
+        max_keys (int | None): Stop after this many objects and rows, so a run can be spread over
+            several invocations.
+        rate (float | None): Process at most this many objects and rows per second, so the run
+            doesn't compete with live traffic for S3 and database capacity.
+        grace (timedelta): Skip objects and rows younger than this.
+        batch_size (int): Page size of the bucket listing and the row queries.
+        report (callable | None): Called with ("object", key) for every orphaned object and
+            ("row", key) for every row whose object is missing.
+
+    Returns:
+        dict: Counts of the objects, rows, orphaned objects and missing objects seen, and
+        "checkpoint", the key to resume after, or None if the whole bucket was reconciled.
+    """
+
+    cutoff = timezone.now() - grace
+    stats = {"objects": 0, "rows": 0, "orphaned_objects": 0, "missing_objects": 0, "checkpoint": None}
+    orphaned_keys, missing_rows = [], {}
+
+    def flush():
+        if orphaned_keys:
+            delete_s3_keys(orphaned_keys)
+            orphaned_keys.clear()
+        for alias, pks in missing_rows.items():
+            File.objects.using(alias).filter(pk__in=pks).delete()
+        missing_rows.clear()
+
+    objects = iter_bucket_objects(start_after, prefix, batch_size)
+    rows = heapq.merge(*(iter_file_rows(alias, start_after, prefix, batch_size) for alias in settings.ROOM_SHARDS))
+    obj, row = next(objects, None), next(rows, None)
+    matched = False
+    last_key = start_after
+    started = time.monotonic()
+    while obj is not None or row is not None:
+        seen = stats["objects"] + stats["rows"]
+        if max_keys is not None and seen >= max_keys:
+            stats["checkpoint"] = last_key
+            break
+        if rate and seen % 100 == 0:
+            ahead = seen / rate - (time.monotonic() - started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+        if row is not None and (obj is None or row[0] <= obj[0]):
+            name, alias, pk, uploaded_at = row
+            if obj is not None and name == obj[0]:
+                matched = True
+            elif uploaded_at < cutoff:
+                stats["missing_objects"] += 1
+                if report:
+                    report("row", name)
+                if delete:
+                    missing_rows.setdefault(alias, []).append(pk)
+            stats["rows"] += 1
+            last_key = name
+            row = next(rows, None)
+        else:
+            key, last_modified = obj
+            if not matched and last_modified < cutoff:
+                stats["orphaned_objects"] += 1
+                if report:
+                    report("object", key)
+                if delete:
+                    orphaned_keys.append(key)
+            stats["objects"] += 1
+            last_key = key
+            matched = False
+            obj = next(objects, None)
+
+        if len(orphaned_keys) >= S3_DELETE_BATCH or sum(map(len, missing_rows.values())) >= batch_size:
+            flush()
+    flush()
+    return stats
+
+
+def load_checkpoint(name=DEFAULT_CHECKPOINT):
+    """
+    Read the key a previous run stopped at.
+
+    Args:
+        name (str): The name of the checkpoint.
+
+    Returns:
+        str: The key, or "" if there is no checkpoint.
+    """
+
+    checkpoint = ReconcileCheckpoint.objects.filter(name=name).first()
+    return checkpoint.start_after if checkpoint else ""
+
+
+def save_checkpoint(key, name=DEFAULT_CHECKPOINT):
+    """
+    Store the key a run stopped at, or clear the checkpoint once the whole bucket was reconciled.
+
+    Args:
+        key (str | None): The key to resume after.
+        name (str): The name of the checkpoint.
+    """
+
+    ReconcileCheckpoint.objects.update_or_create(name=name, defaults={"start_after": key or ""})
@@ -0,0 +1,116 @@
+import hashlib
+
+from django.conf import settings
+
+from .models import Room
+
+"""
+Database routing for the room app.
+
+Rooms are independent of each other, so every room and its files live together on one of the
+databases listed in settings.ROOM_SHARDS. The shard is picked from the room name alone, which is
+all the views know about a room (it is what the session stores).
+
+Functions:
+- shard_for_room: Get the database alias a room belongs on.
+- find_room: Get a room from whichever shard it is stored on.
+
+Classes:
+- RoomShardRouter: Route room app models to their shard and everything else to "default".
+
+"""
+
+
+def shard_for_room(rname):
+    """
+    Get the database alias a room belongs on.
+
+    Uses rendezvous hashing: every shard scores the room name and the highest score wins. The choice
+    is stable across processes, and adding a shard only moves the rooms that the new shard wins,
+    roughly 1/N of them, all onto the new shard.
+
+    Args:
+        rname (str): The name of the room.
+
+    Returns:
+        str: The database alias from settings.ROOM_SHARDS.
+
+    Examples:
+        >>> shard_for_room("lab")
+        'default'
+    """
+
+    return max(
+        settings.ROOM_SHARDS,
+        key=lambda alias: hashlib.blake2b(f"{alias}:{rname}".encode(), digest_size=8).digest(),
+    )
+
+
+def find_room(rname):
+    """
+    Get a room from whichever shard it is stored on.
+
+    A room normally is on shard_for_room(rname), which is tried first. After settings.ROOM_SHARDS
+    changes, rooms stay on their old shard until rebalance_rooms moves them, so on a miss the other
+    shards are searched as well.
+
+    Args:
+        rname (str): The name of the room.
+
+    Returns:
+        Room | None: The room, loaded from its database, or None if no shard has it.
+    """
+
+    home = shard_for_room(rname)
+    for alias in [home, *(alias for alias in settings.ROOM_SHARDS if alias != home)]:
+        if room := Room.objects.using(alias).filter(rname=rname).first():
+            return room
+    return None
+
+
+class RoomShardRouter:
+    """
+    Route Room and File rows to the shard of their room.
+
+    Queries made without an instance hint can't be routed by the room name, so the views pick the
+    shard themselves with find_room and QuerySet.using(). This router covers saving new rows,
+    related lookups (room.file_set) and migrations.
+    """
+
+    app_label = "room"
+    # Room app models that don't belong to a room, kept on "default" like other apps' models.
+    unsharded_models = {"reconcilecheckpoint"}
+
+    def _is_sharded(self, app_label, model_name):
+        return app_label == self.app_label and model_name not in self.unsharded_models
+
+    def _db_for_instance(self, instance):
+        if instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        # Unsaved rooms go to the shard of their name. Unsaved files inherit the database of the room
+        # they are assigned to when File.room is set, so they are covered by the check above.
+        if hasattr(instance, "rname"):
+            return shard_for_room(instance.rname)
+        return None
+
+    def db_for_read(self, model, **hints):
+        if not self._is_sharded(model._meta.app_label, model._meta.model_name):
+            return None
+        return self._db_for_instance(hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        if not self._is_sharded(model._meta.app_label, model._meta.model_name):
+            return None
+        return self._db_for_instance(hints.get("instance"))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.app_label in (obj1._meta.app_label, obj2._meta.app_label):
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if self._is_sharded(app_label, model_name):
+            return db in settings.ROOM_SHARDS
+        return db == "default"
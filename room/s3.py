@@ -0,0 +1,77 @@
+import logging
+import threading
+
+import boto3
+from botocore.client import Config
+from django.conf import settings
+
+"""
+AWS S3 helpers for the room app.
+
+Functions:
+- get_s3_client: Get an S3 client for the current thread.
+- delete_s3_keys: Delete objects from the bucket.
+
+"""
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# DeleteObjects accepts at most this many keys per request.
+S3_DELETE_BATCH = 1000
+
+
+def get_s3_client():
+    """
+    Get an S3 client to perform CRUD and more operations.
+
+    boto3's default session is not thread-safe, so every thread (or greenlet, when the celery
+    worker runs with the gevent pool) builds its own client from a private session and reuses it
+    on later calls. Prefork children create theirs lazily after the fork.
+
+    Returns:
+        botocore.client.S3: The S3 client instance.
+
+    Examples:
+        >>> get_s3_client()
+        <botocore.client.S3>
+    """
+
+    client = getattr(_local, "client", None)
+    if client is None:
+        client = _local.client = boto3.session.Session().client(
+            "s3",
+            region_name="ap-south-1",
+            config=Config(signature_version="s3v4"),
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        )
+    return client
+
+
+def delete_s3_keys(keys):
+    """
+    Delete objects from the bucket, S3_DELETE_BATCH keys per request.
+
+    Args:
+        keys (list[str]): The keys of the objects to delete.
+
+    Returns:
+        list[str]: The keys S3 reported it could not delete. They are logged as well.
+    """
+
+    s3 = get_s3_client()
+    failed = []
+    for start in range(0, len(keys), S3_DELETE_BATCH):
+        response = s3.delete_objects(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Delete={
+                "Objects": [{"Key": key} for key in keys[start : start + S3_DELETE_BATCH]],
+                "Quiet": True,
+            },
+        )
+        for error in response.get("Errors", []):
+            logger.warning("Could not delete %s from S3: %s", error["Key"], error.get("Message"))
+            failed.append(error["Key"])
+    return failed
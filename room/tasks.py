@@ -0,0 +1,134 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from FleetingFiles.celery import app
+
+from . import reconcile
+from .models import File, Room
+from .routers import find_room
+from .s3 import delete_s3_keys
+
+"""
+Celery tasks for the room app.
+
+Tasks are routed to their own queues by CELERY_TASK_ROUTES in settings, so room expiry never waits
+behind other background jobs.
+
+Functions:
+- delete_s3_objects: Delete AWS S3 objects.
+- delete_room: Delete an expired room.
+- reconcile_storage: Find, and optionally reclaim, orphaned objects and rows, a slice of the bucket per run.
+
+"""
+
+logger = logging.getLogger(__name__)
+
+# A claim older than this is treated as abandoned (e.g. the worker holding it was killed) and may
+# be taken over by a redelivered copy of the task.
+EXPIRY_CLAIM_LEASE = timedelta(minutes=5)
+
+
+def delete_s3_objects(files):
+    """
+    Delete S3 objects(files belonging to a particular room).
+
+    Args:
+          files (QuerySet): The files to be deleted.
+
+    Returns:
+          bool: True if there are no files in a room. True if there are files in room and the deletion is successful, False otherwise.
+    """
+    if len(files) == 0:
+        return True
+    return not delete_s3_keys([file_obj.file.name for file_obj in files])
+
+
+# Registered under its name from before the task moved out of room.views, so expiries queued with an
+# ETA by older deployments still find it.
+@app.task(bind=True, name="room.views.delete_room", max_retries=None)
+def delete_room(self, room_name):
+    """
+    Delete an expired room with all the files belonging to it.
+
+    The task is idempotent: with CELERY_TASK_ACKS_LATE the broker may deliver it more than once,
+    and several workers may pick up copies concurrently. A single UPDATE claims the room row, so
+    only one delivery does the work. A copy that finds the room gone returns. A copy that finds the
+    room not expired yet, or claimed by another delivery, retries once the expiry time or the claim's
+    lease has passed, so a delivery redelivered after its worker died still deletes the room. If S3
+    can't be reached the task retries after the lease as well. The room is looked up with find_room, so rooms not yet moved by rebalance_rooms still expire.
+
+    Args:
+        room_name (str): The name of the room to delete.
+
+    Returns:
+        str: A short description of the outcome.
+
+    """
+    now = timezone.now()
+    room = find_room(room_name)
+    if room is None:
+        return "Room already deleted"
+    rooms = Room.objects.using(room._state.db)
+    claimed = rooms.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__lte=now),
+        Q(expiry_claimed_at__isnull=True) | Q(expiry_claimed_at__lt=now - EXPIRY_CLAIM_LEASE),
+        rname=room_name,
+    ).update(expiry_claimed_at=now)
+    if not claimed:
+        if room.expires_at is not None and room.expires_at > now:
+            retry_at = room.expires_at
+        elif room.expiry_claimed_at is not None:
+            retry_at = room.expiry_claimed_at + EXPIRY_CLAIM_LEASE
+        else:
+            # Claimed, deleted or moved to another shard since it was read, look again.
+            retry_at = now
+        raise self.retry(countdown=max((retry_at - now).total_seconds(), 1))
+
+    files = File.objects.using(rooms.db).filter(room__rname=room_name)
+    try:
+        deleted = delete_s3_objects(files)
+    except Exception as exc:
+        # With CELERY_TASK_ACKS_LATE a failed task is still acked, so nothing would redeliver it. Try
+        # again once our claim has lapsed and can be taken over.
+        raise self.retry(exc=exc, countdown=EXPIRY_CLAIM_LEASE.total_seconds())
+    # Only delete while the claim is still ours; files go with the room through CASCADE. The room
+    # expires even if some objects could not be deleted, reconcile_storage reclaims those later.
+    rooms.filter(rname=room_name, expiry_claimed_at=now).delete()
+    if deleted:
+        return "Files deleted succesfully"
+    return "Room deleted, some files were left for reconciliation"
+
+
+def log_orphan(kind, key):
+    if kind == "object":
+        logger.warning("Orphaned object in the bucket: %s", key)
+    else:
+        logger.warning("File row without an object: %s", key)
+
+
+@app.task
+def reconcile_storage():
+    """
+    Find orphaned objects and rows, see room.reconcile, and delete them if RECONCILE_DELETE is set.
+
+    Orphans are logged either way. Every run handles at most RECONCILE_MAX_KEYS objects and rows at
+    RECONCILE_RATE per second, then stores where it stopped in the database for the next run, so a
+    large bucket is covered over several runs without competing with live traffic.
+
+    Returns:
+        dict: The counts returned by room.reconcile.reconcile_storage.
+
+    """
+    stats = reconcile.reconcile_storage(
+        delete=settings.RECONCILE_DELETE,
+        start_after=reconcile.load_checkpoint(),
+        max_keys=settings.RECONCILE_MAX_KEYS,
+        rate=settings.RECONCILE_RATE,
+        report=log_orphan,
+    )
+    reconcile.save_checkpoint(stats["checkpoint"])
+    return stats
@@ -1 +1,590 @@
+import base64
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
+from celery.exceptions import Retry
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import reconcile
+from .cdn import cloudfront_enabled, generate_cloudfront_url, get_cloudfront_signer
+from .models import File, ReconcileCheckpoint, Room
+from .routers import RoomShardRouter, find_room, shard_for_room
+from .tasks import EXPIRY_CLAIM_LEASE, delete_room, reconcile_storage
+from .views import FILES_PER_PAGE, MAX_BATCH_FILES, MAX_UPLOAD_SIZE, decode_cursor, encode_cursor, get_files_page
+
+"""
+Tests for the room app.
+
+Run with: DJANGO_SETTINGS_MODULE=FleetingFiles.settings.test python manage.py test
+
+"""
+
+
+def make_room(rname, **fields):
+    """Create a room on its shard (Room.objects.create would use "default")."""
+    room = Room(rname=rname, rpass="pass", **fields)
+    room.save()
+    return room
+
+
+@mock.patch("room.tasks.delete_s3_keys", return_value=[])
+class DeleteRoomTests(TestCase):
+    databases = "__all__"
+
+    def test_deletes_expired_room_and_files(self, delete_s3_keys):
+        room = make_room("lab", expires_at=timezone.now() - timedelta(seconds=1))
+        File(room=room, file="notes.pdf").save()
+
+        self.assertEqual(delete_room("lab"), "Files deleted succesfully")
+        delete_s3_keys.assert_called_once_with(["notes.pdf"])
+        self.assertFalse(Room.objects.using(room._state.db).filter(rname="lab").exists())
+        self.assertFalse(File.objects.using(room._state.db).exists())
+
+    def test_duplicate_delivery_is_a_no_op(self, delete_s3_keys):
+        room = make_room("lab", expires_at=timezone.now() - timedelta(seconds=1))
+        File(room=room, file="notes.pdf").save()
+
+        delete_room("lab")
+        self.assertEqual(delete_room("lab"), "Room already deleted")
+        self.assertEqual(delete_s3_keys.call_count, 1)
+
+    def test_redelivery_after_worker_crash_retries_after_lease(self, delete_s3_keys):
+        # The worker that claimed the room died before deleting it.
+        claimed_at = timezone.now()
+        room = make_room("lab", expires_at=claimed_at - timedelta(minutes=1), expiry_claimed_at=claimed_at)
+
+        with mock.patch.object(delete_room, "retry", side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                delete_room("lab")
+        countdown = retry.call_args.kwargs["countdown"]
+        self.assertAlmostEqual(countdown, EXPIRY_CLAIM_LEASE.total_seconds(), delta=5)
+        self.assertTrue(Room.objects.using(room._state.db).filter(rname="lab").exists())
+
+        # Once the lease has passed the redelivered copy takes over the claim.
+        Room.objects.using(room._state.db).update(expiry_claimed_at=claimed_at - EXPIRY_CLAIM_LEASE)
+        self.assertEqual(delete_room("lab"), "Files deleted succesfully")
+        self.assertFalse(Room.objects.using(room._state.db).filter(rname="lab").exists())
+
+    def test_early_delivery_retries_at_expiry(self, delete_s3_keys):
+        room = make_room("lab", expires_at=timezone.now() + timedelta(minutes=10))
+
+        with mock.patch.object(delete_room, "retry", side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                delete_room("lab")
+        self.assertAlmostEqual(retry.call_args.kwargs["countdown"], 600, delta=5)
+        self.assertTrue(Room.objects.using(room._state.db).filter(rname="lab").exists())
+        delete_s3_keys.assert_not_called()
+
+    def test_s3_failure_retries_after_lease(self, delete_s3_keys):
+        room = make_room("lab", expires_at=timezone.now() - timedelta(seconds=1))
+        File(room=room, file="notes.pdf").save()
+        delete_s3_keys.side_effect = ConnectionError("S3 unreachable")
+
+        with mock.patch.object(delete_room, "retry", side_effect=Retry()) as retry:
+            with self.assertRaises(Retry):
+                delete_room("lab")
+        self.assertIsInstance(retry.call_args.kwargs["exc"], ConnectionError)
+        self.assertEqual(retry.call_args.kwargs["countdown"], EXPIRY_CLAIM_LEASE.total_seconds())
+        self.assertTrue(File.objects.using(room._state.db).exists())
+
+        # The retry takes over the lapsed claim and finishes the job.
+        delete_s3_keys.side_effect = None
+        Room.objects.using(room._state.db).update(expiry_claimed_at=timezone.now() - EXPIRY_CLAIM_LEASE)
+        self.assertEqual(delete_room("lab"), "Files deleted succesfully")
+
+    def test_keeps_registered_name(self, delete_s3_keys):
+        self.assertEqual(delete_room.name, "room.views.delete_room")
+
+
+class UploadTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.room = make_room("lab", expires_at=timezone.now() + timedelta(minutes=30))
+        session = self.client.session
+        session["rname"] = "lab"
+        session.save()
+
+    def upload(self, *files, accept="application/json, text/plain, */*"):
+        return self.client.post(reverse("upload"), {"document": list(files)}, HTTP_ACCEPT=accept)
+
+    def test_reports_stored_name(self):
+        self.upload(SimpleUploadedFile("notes.txt", b"first"))
+        response = self.upload(SimpleUploadedFile("notes.txt", b"second"))
+
+        [result] = response.json()["files"]
+        self.assertEqual(result["name"], "notes.txt")
+        self.assertTrue(result["uploaded"])
+        self.assertNotEqual(result["stored_name"], "notes.txt")
+        self.assertTrue(File.objects.using(self.room._state.db).filter(file=result["stored_name"]).exists())
+
+    def test_uploaded_files_are_searchable(self):
+        self.upload(SimpleUploadedFile("Überblick.txt", b"x"))
+
+        response = self.client.get(reverse("list_files"), {"q": "über"})
+        self.assertEqual([f["name"] for f in response.json()["files"]], ["Überblick.txt"])
+
+    def test_rejects_oversized_files_only(self):
+        response = self.upload(
+            SimpleUploadedFile("small.txt", b"x"),
+            SimpleUploadedFile("big.txt", b"x" * (MAX_UPLOAD_SIZE + 1)),
+        )
+
+        small, big = response.json()["files"]
+        self.assertTrue(small["uploaded"])
+        self.assertEqual(small["stored_name"], "small.txt")
+        self.assertFalse(big["uploaded"])
+        self.assertIsNone(big["stored_name"])
+        self.assertEqual(File.objects.using(self.room._state.db).count(), 1)
+
+    def test_rejected_batch_is_reported_as_json(self):
+        response = self.upload(*(SimpleUploadedFile(f"{i}.txt", b"x") for i in range(MAX_BATCH_FILES + 1)))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": f"Only {MAX_BATCH_FILES} files can be uploaded at once."})
+
+        with mock.patch("room.views.MAX_BATCH_SIZE", 2):
+            response = self.upload(SimpleUploadedFile("notes.txt", b"xyz"))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("error", response.json())
+        self.assertFalse(File.objects.using(self.room._state.db).exists())
+
+    def test_storage_errors_are_logged(self):
+        storage = File._meta.get_field("file").storage
+        with mock.patch.object(storage, "save", side_effect=OSError("bucket unreachable")):
+            with self.assertLogs("room.views", "ERROR") as logs:
+                response = self.upload(SimpleUploadedFile("notes.txt", b"x"))
+
+        [result] = response.json()["files"]
+        self.assertFalse(result["uploaded"])
+        self.assertIn("bucket unreachable", logs.output[0])
+
+    def test_download_only_serves_files_of_own_room(self):
+        other = make_room("other")
+        File(room=other, file="secret.pdf").save()
+
+        response = self.client.get(reverse("download_file", args=["secret.pdf"]))
+        self.assertContains(response, "File not found")
+
+    def test_browser_form_post_redirects(self):
+        response = self.upload(
+            SimpleUploadedFile("notes.txt", b"x"), accept="text/html,application/xhtml+xml,*/*;q=0.8"
+        )
+        self.assertRedirects(response, reverse("room"), fetch_redirect_response=False)
+
+
+class ShardTests(TestCase):
+    databases = "__all__"
+
+    def test_shard_for_room_is_stable(self):
+        # Pinned so a change to the hash, which would strand every existing room, fails loudly.
+        self.assertEqual(
+            [shard_for_room(f"room{i}") for i in range(6)],
+            ["shard_2", "shard_2", "shard_1", "default", "default", "shard_1"],
+        )
+        self.assertEqual({shard_for_room(f"room{i}") for i in range(100)}, {"default", "shard_1", "shard_2"})
+
+    def test_adding_a_shard_only_moves_rooms_onto_it(self):
+        rnames = [f"room{i}" for i in range(300)]
+        with override_settings(ROOM_SHARDS=["default", "shard_1"]):
+            before = {rname: shard_for_room(rname) for rname in rnames}
+        moved = [rname for rname in rnames if shard_for_room(rname) != before[rname]]
+
+        self.assertTrue(moved)
+        self.assertEqual({shard_for_room(rname) for rname in moved}, {"shard_2"})
+
+    def test_allow_migrate(self):
+        router = RoomShardRouter()
+        self.assertTrue(router.allow_migrate("shard_1", "room", "file"))
+        self.assertFalse(router.allow_migrate("other", "room", "file"))
+        self.assertTrue(router.allow_migrate("default", "sessions"))
+        self.assertTrue(router.allow_migrate("default", "room", "reconcilecheckpoint"))
+        self.assertFalse(router.allow_migrate("shard_1", "room", "reconcilecheckpoint"))
+        self.assertFalse(router.allow_migrate("shard_1", "sessions"))
+
+    def test_allow_relation(self):
+        router = RoomShardRouter()
+        room = Room(rname="lab")
+        room._state.db = "shard_1"
+        same, other = File(), File()
+        same._state.db, other._state.db = "shard_1", "shard_2"
+        self.assertTrue(router.allow_relation(room, same))
+        self.assertFalse(router.allow_relation(room, other))
+
+    def test_find_room_falls_back_to_other_shards(self):
+        with override_settings(ROOM_SHARDS=["default"]):
+            room = make_room("lab")
+        self.assertEqual(find_room("lab").pk, room.pk)
+        self.assertIsNone(find_room("missing"))
+
+    @mock.patch("room.tasks.delete_s3_keys", return_value=[])
+    def test_unmoved_room_still_expires(self, delete_s3_keys):
+        with override_settings(ROOM_SHARDS=["default"]):
+            make_room("lab", expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertNotEqual(shard_for_room("lab"), "default")
+
+        self.assertEqual(delete_room("lab"), "Files deleted succesfully")
+        self.assertIsNone(find_room("lab"))
+
+    def test_create_room_rejects_name_taken_on_another_shard(self):
+        # Pick a name that doesn't hash to "default", where the form's own unique check would look.
+        rname = next(f"room{i}" for i in range(100) if shard_for_room(f"room{i}") != "default")
+        make_room(rname)
+
+        response = self.client.post(reverse("create_room"), {"rname": rname, "rpass": "other"})
+        self.assertContains(response, "Room with that name already exists!")
+        self.assertNotIn("rname", self.client.session)
+
+    def test_rebalance_rooms(self):
+        with override_settings(ROOM_SHARDS=["default"]):
+            rooms = [make_room(f"room{i}") for i in range(10)]
+            for room in rooms:
+                File(room=room, file=f"{room.rname}.pdf").save()
+        File.objects.using("default").update(uploaded_at=timezone.now() - timedelta(minutes=5))
+        uploaded_at = File.objects.using("default").first().uploaded_at
+
+        call_command("rebalance_rooms", stdout=StringIO())
+
+        for room in rooms:
+            shard = shard_for_room(room.rname)
+            self.assertTrue(Room.objects.using(shard).filter(rname=room.rname).exists())
+            moved = File.objects.using(shard).get(room__rname=room.rname)
+            self.assertEqual(moved.file.name, f"{room.rname}.pdf")
+            self.assertEqual(moved.uploaded_at, uploaded_at)
+        self.assertEqual(
+            Room.objects.using("default").count(),
+            sum(shard_for_room(room.rname) == "default" for room in rooms),
+        )
+
+    def test_rebalance_leaves_room_that_gained_a_file(self):
+        rname = next(f"room{i}" for i in range(100) if shard_for_room(f"room{i}") != "default")
+        with override_settings(ROOM_SHARDS=["default"]):
+            room = make_room(rname)
+        File(room=room, file="first.pdf").save()
+
+        def upload_during_move(sender, instance, using, **kwargs):
+            # An upload lands on the old shard after the room's files were read for copying.
+            if using != "default" and instance.file.name == "first.pdf":
+                File(room=room, file="late.pdf").save()
+
+        post_save.connect(upload_during_move, sender=File)
+        self.addCleanup(post_save.disconnect, upload_during_move, sender=File)
+        err = StringIO()
+        call_command("rebalance_rooms", stdout=StringIO(), stderr=err)
+
+        self.assertIn("files were added while moving", err.getvalue())
+        self.assertTrue(File.objects.using("default").filter(room__rname=rname, file="first.pdf").exists())
+        self.assertFalse(Room.objects.using(shard_for_room(rname)).filter(rname=rname).exists())
+
+class FakeBucket:
+    """Stand-in for the S3 client, listing keys in byte order like list_objects_v2."""
+
+    def __init__(self, objects, page_size=2):
+        self.objects = sorted(objects.items())
+        self.page_size = page_size
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, Bucket, Prefix="", StartAfter="", PaginationConfig=None):
+        keys = [(key, modified) for key, modified in self.objects if key.startswith(Prefix) and key > StartAfter]
+        for start in range(0, len(keys), self.page_size):
+            yield {"Contents": [{"Key": key, "LastModified": modified} for key, modified in keys[start : start + self.page_size]]}
+
+
+class ReconcileTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.old = timezone.now() - timedelta(days=1)
+        self.new = timezone.now()
+        # Rooms on every shard, with rows for "a", "b" (uploaded twice, in two rooms) and "e".
+        for rname, names in [("room0", ["a", "b"]), ("room2", ["b"]), ("room3", ["e"])]:
+            room = make_room(rname)
+            for name in names:
+                File(room=room, file=name).save()
+        for alias in ["default", "shard_1", "shard_2"]:
+            File.objects.using(alias).update(uploaded_at=self.old)
+        # "c" and "d" have no row, "e" has no object.
+        bucket = FakeBucket({"a": self.old, "b": self.old, "c": self.old, "d": self.old})
+        self.deleted = []
+        for patcher in [
+            mock.patch("room.reconcile.get_s3_client", return_value=bucket),
+            mock.patch("room.reconcile.delete_s3_keys", side_effect=lambda keys: self.deleted.extend(keys) or []),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def reconcile(self, **kwargs):
+        found = []
+        stats = reconcile.reconcile_storage(report=lambda kind, key: found.append((kind, key)), batch_size=2, **kwargs)
+        return stats, found
+
+    def test_finds_orphans_in_both_directions(self):
+        stats, found = self.reconcile()
+
+        self.assertEqual(found, [("object", "c"), ("object", "d"), ("row", "e")])
+        self.assertEqual(stats["objects"], 4)
+        self.assertEqual(stats["rows"], 4)
+        self.assertIsNone(stats["checkpoint"])
+        self.assertEqual(self.deleted, [])
+
+    def test_skips_recent_objects_and_rows(self):
+        File.objects.using(shard_for_room("room3")).update(uploaded_at=self.new)
+        with mock.patch("room.reconcile.get_s3_client", return_value=FakeBucket({"c": self.new, "d": self.old})):
+            stats, found = self.reconcile()
+
+        self.assertIn(("object", "d"), found)
+        self.assertNotIn(("object", "c"), found)
+        self.assertNotIn(("row", "e"), found)
+
+    def test_deletes_orphans(self):
+        self.reconcile(delete=True)
+
+        self.assertEqual(self.deleted, ["c", "d"])
+        self.assertFalse(File.objects.using(shard_for_room("room3")).filter(file="e").exists())
+        self.assertTrue(File.objects.using(shard_for_room("room0")).filter(file="a").exists())
+
+    def test_resumes_from_checkpoint(self):
+        stats, found = self.reconcile(max_keys=3)
+        self.assertIsNotNone(stats["checkpoint"])
+        reconcile.save_checkpoint(stats["checkpoint"])
+
+        stats, rest = self.reconcile(start_after=reconcile.load_checkpoint())
+        self.assertEqual(found + rest, [("object", "c"), ("object", "d"), ("row", "e")])
+        self.assertIsNone(stats["checkpoint"])
+
+    def test_command_leaves_shared_checkpoint_alone(self):
+        reconcile.save_checkpoint("b")
+
+        call_command("reconcile_storage", "--max-keys=2", "--grace-minutes=0", "--rate=0", stdout=StringIO())
+        self.assertEqual(reconcile.load_checkpoint(), "b")
+
+        call_command(
+            "reconcile_storage", "--resume", "--max-keys=2", "--grace-minutes=0", "--rate=0", stdout=StringIO()
+        )
+        self.assertEqual(reconcile.load_checkpoint(), "d")
+
+    def test_command_keeps_its_own_checkpoint(self):
+        out = StringIO()
+        call_command("reconcile_storage", "--checkpoint=mine", "--prefix=c", "--rate=0", stdout=out)
+
+        self.assertIn("orphaned object: c", out.getvalue())
+        self.assertEqual(reconcile.load_checkpoint("mine"), "")
+        self.assertFalse(ReconcileCheckpoint.objects.filter(name=reconcile.DEFAULT_CHECKPOINT).exists())
+
+    def test_command_refuses_prefix_on_shared_checkpoint(self):
+        with self.assertRaises(CommandError):
+            call_command("reconcile_storage", "--prefix=c", stdout=StringIO())
+
+    def test_task_only_reports_by_default(self):
+        with self.assertLogs("room.tasks", "WARNING") as logs:
+            stats = reconcile_storage()
+
+        self.assertEqual(stats["orphaned_objects"], 2)
+        self.assertEqual(len(logs.output), 3)
+        self.assertEqual(self.deleted, [])
+        self.assertEqual(ReconcileCheckpoint.objects.get(name=reconcile.DEFAULT_CHECKPOINT).start_after, "")
+
+    @override_settings(RECONCILE_DELETE=True, RECONCILE_MAX_KEYS=6)
+    def test_task_deletes_when_enabled_and_stores_checkpoint(self):
+        # The first run stops after "c": a, a, b, b, b, c.
+        with self.assertLogs("room.tasks", "WARNING"):
+            reconcile_storage()
+        self.assertEqual(reconcile.load_checkpoint(), "c")
+
+        with self.assertLogs("room.tasks", "WARNING"):
+            reconcile_storage()
+        self.assertEqual(reconcile.load_checkpoint(), "")
+        self.assertEqual(self.deleted, ["c", "d"])
+
+
+class ListFilesTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.room = make_room("lab", expires_at=timezone.now() + timedelta(minutes=30))
+        session = self.client.session
+        session["rname"] = "lab"
+        session.save()
+
+    def add_files(self, *names, uploaded_at=None):
+        for name in names:
+            File(room=self.room, file=name).save()
+        if uploaded_at is not None:
+            File.objects.using(self.room._state.db).filter(file__in=names).update(uploaded_at=uploaded_at)
+
+    def test_cursor_round_trip(self):
+        self.add_files("notes.pdf")
+        file_obj = File.objects.using(self.room._state.db).get()
+        self.assertEqual(decode_cursor(encode_cursor(file_obj)), (file_obj.uploaded_at, file_obj.id))
+
+    def test_pages_split_ties_on_upload_time(self):
+        self.add_files(*(f"{i}.txt" for i in range(5)), uploaded_at=timezone.now())
+
+        names, after = [], None
+        while True:
+            files, after = get_files_page(self.room, after=after, limit=2)
+            names += [file_obj.file.name for file_obj in files]
+            if after is None:
+                break
+        self.assertEqual(names, [f"{i}.txt" for i in range(5)])
+
+    def test_search_ignores_case(self):
+        self.add_files("Report.PDF", "notes.txt", "old_report.pdf")
+
+        files, _ = get_files_page(self.room, query="REPORT")
+        self.assertEqual([file_obj.file.name for file_obj in files], ["Report.PDF", "old_report.pdf"])
+
+    def test_search_folds_non_ascii_names(self):
+        self.add_files("Äpfel.pdf", "birnen.pdf")
+
+        for query in ["ä", "ÄPFEL"]:
+            with self.subTest(query=query):
+                files, _ = get_files_page(self.room, query=query)
+                self.assertEqual([file_obj.file.name for file_obj in files], ["Äpfel.pdf"])
+
+    def test_list_files_follows_cursor(self):
+        names = [f"{i:03}.txt" for i in range(FILES_PER_PAGE + 1)]
+        self.add_files(*names)
+        first = self.client.get(reverse("list_files")).json()
+        second = self.client.get(reverse("list_files"), {"after": first["next"]}).json()
+
+        self.assertEqual(len(first["files"]), FILES_PER_PAGE)
+        self.assertEqual([f["name"] for f in first["files"] + second["files"]], names)
+        self.assertIsNone(second["next"])
+
+    def test_list_files_rejects_bad_cursors(self):
+        for cursor in ["nonsense", "1-2-3", "99999999999999999999999-1", "0-99999999999999999999999", "0-0"]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse("list_files"), {"after": cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "Invalid cursor"})
+
+
+class StaticPagesTests(TestCase):
+    """Render the pages the way production serves them, from the collected static manifest."""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        static_root = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(static_root.cleanup)
+        cls.enterClassContext(
+            override_settings(
+                DEBUG=False,
+                STATIC_ROOT=static_root.name,
+                STORAGES={
+                    **settings.STORAGES,
+                    "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+                },
+            )
+        )
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def test_pages_render(self):
+        make_room("lab")
+        for name in ["home", "create_room", "join_room", "room"]:
+            with self.subTest(page=name):
+                if name == "room":
+                    session = self.client.session
+                    session["rname"] = "lab"
+                    session.save()
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertNotContains(response, "fonts.googleapis.com")
+
+
+class CloudFrontTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # A throwaway key pair; CloudFront would hold the public half.
+        cls.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        key_file = tempfile.NamedTemporaryFile(suffix=".pem", delete=False)
+        key_file.write(
+            cls.private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            )
+        )
+        key_file.close()
+        cls.addClassCleanup(os.remove, key_file.name)
+        cls.key_path = key_file.name
+
+    def setUp(self):
+        get_cloudfront_signer.cache_clear()
+        self.addCleanup(get_cloudfront_signer.cache_clear)
+        self.enterContext(
+            override_settings(
+                CLOUDFRONT_DOMAIN="d111111abcdef8.cloudfront.net",
+                CLOUDFRONT_KEY_ID="K2JCJMDEHXQW5F",
+                CLOUDFRONT_PRIVATE_KEY_PATH=self.key_path,
+                CLOUDFRONT_URL_EXPIRY=120,
+            )
+        )
+
+    def verify(self, url):
+        """Check a signed URL against the canned policy CloudFront would rebuild from it."""
+        params = parse_qs(urlsplit(url).query)
+        resource = url.split("&Expires=")[0]
+        policy = json.dumps(
+            {"Statement": [{"Resource": resource, "Condition": {"DateLessThan": {"AWS:EpochTime": int(params["Expires"][0])}}}]},
+            separators=(",", ":"),
+        )
+        signature = base64.b64decode(params["Signature"][0].translate(str.maketrans("-_~", "+=/")))
+        self.private_key.public_key().verify(signature, policy.encode(), padding.PKCS1v15(), hashes.SHA1())
+        return params
+
+    def test_enabled_only_when_fully_configured(self):
+        self.assertTrue(cloudfront_enabled())
+        with override_settings(CLOUDFRONT_KEY_ID=None):
+            self.assertFalse(cloudfront_enabled())
+
+    def test_signed_url(self):
+        url = generate_cloudfront_url("lecture notes.pdf")
+
+        self.assertTrue(url.startswith("https://d111111abcdef8.cloudfront.net/lecture%20notes.pdf?"))
+        params = self.verify(url)
+        self.assertEqual(params["Key-Pair-Id"], ["K2JCJMDEHXQW5F"])
+        self.assertEqual(params["response-content-disposition"], ['attachment; filename="lecture notes.pdf"'])
+        self.assertAlmostEqual(int(params["Expires"][0]), timezone.now().timestamp() + 120, delta=5)
+
+    def test_signer_is_cached(self):
+        self.assertIs(get_cloudfront_signer(), get_cloudfront_signer())
+
+    def test_download_redirects_to_cloudfront(self):
+        room = make_room("lab")
+        File(room=room, file="notes.pdf").save()
+        session = self.client.session
+        session["rname"] = "lab"
+        session.save()
+
+        with mock.patch("room.views.generate_presigned_url") as presign:
+            response = self.client.get(reverse("download_file", args=["notes.pdf"]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response["Location"].startswith("https://d111111abcdef8.cloudfront.net/notes.pdf?"))
+        self.verify(response["Location"])
+        presign.assert_not_called()
+
+        with override_settings(CLOUDFRONT_DOMAIN=None), mock.patch(
+            "room.views.generate_presigned_url", return_value="https://test.s3.amazonaws.com/notes.pdf"
+        ) as presign:
+            response = self.client.get(reverse("download_file", args=["notes.pdf"]))
+        self.assertEqual(response["Location"], "https://test.s3.amazonaws.com/notes.pdf")
+        presign.assert_called_once_with("notes.pdf")
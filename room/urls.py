@@ -11,6 +11,7 @@ Functions:
 - create_room(request): Creates a new room.
 - join_room(request): Joins an existing room.
 - leave_room(request): Leaves a room.
+- list_files(request): Lists the files in a room as JSON.
 - upload(request): Handles file uploads.
 - download_file(request, file_name): Downloads a file from the media directory.
 - delete_room(request): Deletes a room.
@@ -23,6 +24,7 @@ urlpatterns = [
     path('create_room', views.create_room, name="create_room"),
     path('join_room', views.join_room, name="join_room"),
     path('leave_room', views.leave_room, name="leave_room"),
+    path('files', views.list_files, name="list_files"),
     path('upload', views.upload, name="upload"),
     path('media/file/<str:file_name>/', views.download_file, name='download_file'),
     # path('delete_room', views.delete_room, name='delete_room'),
@@ -1,57 +1,59 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from functools import wraps
 
-import boto3
 import pytz
-from botocore.client import Config
 from django.conf import settings
 from django.contrib import messages
-from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
+from django.http import JsonResponse
 from django.shortcuts import HttpResponse, redirect, render
 
-from FleetingFiles.celery import app
-
+from .cdn import cloudfront_enabled, generate_cloudfront_url
 from .forms import CreateRoom
-from .models import File, Room
+from .models import File, Room, search_key
+from .routers import find_room, shard_for_room
+from .s3 import get_s3_client
+from .tasks import delete_room
 
 """
 Views for managing rooms and files.
 
 Functions:
-- get_s3_client: Get an S3 client.
 - room_required: Decorator to require a room for a view function.
 - create_room: Create a new room.
 - join_room: Join an existing room.
 - leave_room: Leave the current room.
+- encode_cursor: Encode the position of a file in the room listing.
+- decode_cursor: Decode a cursor made by encode_cursor.
+- get_files_page: Get one page of the files in a room.
 - room: View the current room.
-- delete_s3_objects: Delete AWS S3 objects.
-- delete_room: Delete the current room.
-- upload: Upload a file to the current room.
+- list_files: List the files in the current room as JSON.
+- save_uploaded_files: Write uploaded files to storage concurrently.
+- upload: Upload a batch of files to the current room.
 - generate_presigned_url: Generate a presigned URL for a file.
 - download_file: Download a file from the current room.
 
 """
 
+logger = logging.getLogger(__name__)
 
-def get_s3_client():
-    """
-    Get an S3 client to perform CRUD and more operations.
 
-    Returns:
-        botocore.client.S3: The S3 client instance.
+# Rooms, and every file in them, are deleted this long after creation.
+ROOM_LIFETIME = timedelta(minutes=30)
 
-    Examples:
-        >>> get_s3_client()
-        <botocore.client.S3>
-    """
+# Upload limits. Every file must fit MAX_UPLOAD_SIZE, and a single upload request may carry at most
+# MAX_BATCH_FILES files totalling MAX_BATCH_SIZE.
+MAX_UPLOAD_SIZE = 5242880  # 5MB
+MAX_BATCH_SIZE = 52428800  # 50MB
+MAX_BATCH_FILES = 30
+# Number of files written to storage at the same time while handling one upload request.
+UPLOAD_CONCURRENCY = 4
 
-    return boto3.client(
-        "s3",
-        region_name="ap-south-1",
-        config=Config(signature_version="s3v4"),
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    )
+# Number of files rendered with the room page and returned per request by list_files.
+FILES_PER_PAGE = 60
 
 
 def room_required(view_func):
@@ -106,24 +108,27 @@ def create_room(request):
 
     # request.session.flush()
     form = CreateRoom(request.POST)
-    if form.is_valid():
-        room, created = Room.objects.get_or_create(
-            rname=form.cleaned_data["rname"],
-            defaults={"rpass": form.cleaned_data["rpass"]},
-        )
-        if created:
-            request.session["rname"] = room.rname
-            delete_room.apply_async(
-                args=[room.rname],
-                eta=datetime.now(pytz.timezone("UTC")) + timedelta(minutes=30),
-            )
-            return redirect("room")
+    if not form.is_valid():
+        messages.error(request, "Room creation failed")
+        return render(request, "create_room.html")
 
-    if form.has_error("rname", "unique"):
+    rname = form.cleaned_data["rname"]
+    created = False
+    if find_room(rname) is None:
+        # get_or_create still settles a race between two requests for the same name.
+        room, created = Room.objects.using(shard_for_room(rname)).get_or_create(
+            rname=rname,
+            defaults={
+                "rpass": form.cleaned_data["rpass"],
+                "expires_at": datetime.now(pytz.timezone("UTC")) + ROOM_LIFETIME,
+            },
+        )
+    if not created:
         messages.error(request, "Room with that name already exists!")
-    else:
-        messages.error(request, "Room creation failed")
-    return render(request, "create_room.html")
+        return render(request, "create_room.html")
+    request.session["rname"] = room.rname
+    delete_room.apply_async(args=[room.rname], eta=room.expires_at)
+    return redirect("room")
 
 
 def join_room(request):
@@ -146,7 +151,7 @@ def join_room(request):
     if request.method == "POST":
         rname = request.POST.get("rname")
         rpass = request.POST.get("rpass")
-        if room := Room.objects.filter(rname=rname, rpass=rpass).first():
+        if (room := find_room(rname)) and room.rpass == rpass:
             request.session["rname"] = room.rname
             return redirect("room")
         else:
@@ -159,6 +164,78 @@ def leave_room(request):
     return redirect("/")
 
 
+def encode_cursor(file_obj):
+    """
+    Encode the position of a file in the listing order as an opaque cursor.
+
+    Args:
+        file_obj (File): The last file of a page.
+
+    Returns:
+        str: The cursor, "<microseconds since the epoch>-<id>".
+    """
+    delta = file_obj.uploaded_at - datetime(1970, 1, 1, tzinfo=pytz.timezone("UTC"))
+    return f"{delta // timedelta(microseconds=1)}-{file_obj.id}"
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        tuple[datetime, int]: The upload time and id of the file the cursor points at.
+
+    Raises:
+        ValueError: If the cursor is malformed or out of range.
+    """
+    microseconds, file_id = map(int, cursor.split("-"))
+    # File ids are signed 64-bit integers in every supported database.
+    if not 0 < file_id < 2**63:
+        raise ValueError(f"File id out of range: {file_id}")
+    try:
+        uploaded_at = datetime(1970, 1, 1, tzinfo=pytz.timezone("UTC")) + timedelta(microseconds=microseconds)
+    except OverflowError as exc:
+        raise ValueError(f"Upload time out of range: {microseconds}") from exc
+    return uploaded_at, file_id
+
+
+def get_files_page(room, after=None, query="", limit=FILES_PER_PAGE):
+    """
+    Get one page of the files in a room, in upload order.
+
+    Pages are selected by keyset pagination on (uploaded_at, id) rather than OFFSET, so every page
+    is a range scan of the (room, uploaded_at, id) index and costs the same however deep it is. A
+    search filters that same scan, which stops as soon as the page is full, so it reads at most the
+    files of one room.
+
+    Args:
+        room (Room): The room.
+        after (str | None): Cursor of the last file of the previous page.
+        query (str): Only return files whose name contains this, ignoring case.
+        limit (int): Maximum number of files returned.
+
+    Returns:
+        tuple[list[File], str | None]: The files, and the cursor of the next page or None if this is
+        the last page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    files = room.file_set.order_by("uploaded_at", "id")
+    if query:
+        files = files.filter(search_name__contains=search_key(query))
+    if after:
+        uploaded_at, file_id = decode_cursor(after)
+        files = files.filter(Q(uploaded_at__gt=uploaded_at) | Q(uploaded_at=uploaded_at, id__gt=file_id))
+    page = list(files[: limit + 1])
+    if len(page) > limit:
+        return page[:limit], encode_cursor(page[limit - 1])
+    return page, None
+
+
 @room_required
 def room(request):
     """
@@ -168,92 +245,178 @@ def room(request):
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        HttpResponse: The rendered HTML template with all the files belonging to this room.
+        HttpResponse: The rendered HTML template with the first page of files belonging to this room,
+        filtered by the "q" query parameter. Further pages are loaded from list_files.
 
     Examples:
         >>> room(request)
         <HttpResponse>
     """
     rname = request.session["rname"]
-    try:
-        room = Room.objects.get(rname=rname)
-    except ObjectDoesNotExist:
+    room = find_room(rname)
+    if room is None:
         request.session.flush()
         return HttpResponse('<h3 align="center" style="font-family:Open Sans">Room has expired!</h3>')
-    files = File.objects.filter(room=room)
-    return render(request, "room.html", {"files": files, "rname": rname})
+    query = request.GET.get("q", "").strip()
+    files, next_cursor = get_files_page(room, query=query)
+    return render(
+        request,
+        "room.html",
+        {
+            "files": files,
+            "next_cursor": next_cursor,
+            "query": query,
+            "rname": rname,
+            "max_upload_size": MAX_UPLOAD_SIZE,
+            "max_batch_size": MAX_BATCH_SIZE,
+            "max_batch_files": MAX_BATCH_FILES,
+        },
+    )
 
 
-def delete_s3_objects(files):
+@room_required
+def list_files(request):
     """
-    Delete S3 objects(files belonging to a particular room).
+    List the files in the current room as JSON, one page at a time.
 
     Args:
-          files (QuerySet): The files to be deleted.
+        request (HttpRequest): The HTTP request, with optional "after" (cursor of the previous page)
+            and "q" (name search) query parameters.
 
     Returns:
-          bool: True if there are no files in a room. True if there are files in room and the deletion is successful, False otherwise.
+        JsonResponse: The names and upload times of the files, and the cursor of the next page.
+
     """
-    if len(files) == 0:
-        return True
-    s3 = get_s3_client()
-    s3.delete_objects(
-        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-        Delete={
-            "Objects": [{"Key": file_obj.file.name} for file_obj in files],
-            "Quiet": False,
-        },
+    rname = request.session["rname"]
+    room = find_room(rname)
+    if room is None:
+        request.session.flush()
+        return JsonResponse({"error": "Room has expired"}, status=404)
+    try:
+        files, next_cursor = get_files_page(
+            room, after=request.GET.get("after"), query=request.GET.get("q", "").strip()
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+    return JsonResponse(
+        {
+            "files": [{"name": file_obj.file.name, "uploaded_at": file_obj.uploaded_at} for file_obj in files],
+            "next": next_cursor,
+        }
     )
-    return True
 
 
-@app.task
-def delete_room(room_name):
+def save_uploaded_files(request_files):
     """
-    Delete the current room with all the files belonging to it.
+    Write uploaded files to the storage of File.file, at most UPLOAD_CONCURRENCY at a time.
+
+    Files sharing a name within the batch get distinct names up front, because concurrent writes
+    could otherwise all claim the same free name in the storage.
 
     Args:
-        request (HttpRequest): The HTTP request.
+        request_files (list[UploadedFile]): The uploaded files.
 
     Returns:
-        Union[HttpResponse, HttpResponseRedirect]: The HTTP response.
-
+        list[tuple[str | None, Exception | None]]: For every file, in order, the name it was stored
+        under, or the error that prevented storing it.
     """
-    room = Room.objects.get(rname=room_name)
-    files = File.objects.filter(room=room)
-    if delete_s3_objects(files):
-        files.delete()
-        room.delete()
-        return "Files deleted succesfully"
-    else:
-        return "Files deletion failed"
+    field = File._meta.get_field("file")
+    names, seen = [], set()
+    for request_file in request_files:
+        name = field.generate_filename(None, request_file.name)
+        while name in seen:
+            name = field.storage.get_alternative_name(*os.path.splitext(name))
+        seen.add(name)
+        names.append(name)
+
+    def _save(item):
+        request_file, name = item
+        try:
+            return field.storage.save(name, request_file, max_length=field.max_length), None
+        except Exception as exc:
+            logger.exception("Could not store uploaded file %s as %s", request_file.name, name)
+            return None, exc
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as executor:
+        return list(executor.map(_save, zip(request_files, names)))
 
 
 @room_required
 def upload(request):
     """
-    Upload a file to the current room.
+    Upload a batch of files to the current room.
+
+    The files are written to storage concurrently and recorded with a single bulk insert. Files over
+    the size limit, or that fail to store, are skipped and reported without failing the rest of the
+    batch. Clients that accept application/json get the per-file results as JSON, or a JSON error
+    with status 400 or 413 if the whole batch is rejected. Others are redirected to the room with a
+    message for every failed file.
 
     Args:
         request (HttpRequest): The HTTP request.
 
     Returns:
-        Union[HttpResponse, HttpResponseRedirect]: The HTTP response.
+        Union[HttpResponse, HttpResponseRedirect, JsonResponse]: The HTTP response.
 
     """
     if request.method != "POST":
         return render(request, "uploader.html")
 
-    request_file = request.FILES.get("document")
-    if not request_file:
+    wants_json = "application/json" in request.headers.get("Accept", "")
+    request_files = request.FILES.getlist("document")
+    if not request_files:
+        if wants_json:
+            return JsonResponse({"error": "No file found"}, status=400)
         return HttpResponse("No file found")
-    if request_file.size > 5242880 :  # File must not be greater than 5MB
-        return HttpResponse('<h3 align="center" style="font-family:Open Sans">File size exceeds the limit of 5MB.</h3>')
-
-    room = Room.objects.get(rname=request.session["rname"])
-    file = File(room=room, file=request_file)
-    # this will save the file to default storage configured in settings.py, we can later access the file name using object.name, and url using object.url.
-    file.save()
+    if len(request_files) > MAX_BATCH_FILES:
+        error, status = f"Only {MAX_BATCH_FILES} files can be uploaded at once.", 400
+    elif sum(request_file.size for request_file in request_files) > MAX_BATCH_SIZE:
+        error, status = f"Upload exceeds the limit of {MAX_BATCH_SIZE // 1048576}MB.", 413
+    else:
+        error = None
+    if error is not None:
+        if wants_json:
+            return JsonResponse({"error": error}, status=status)
+        return HttpResponse(f'<h3 align="center" style="font-family:Open Sans">{error}</h3>')
+
+    room = find_room(request.session["rname"])
+    if room is None:
+        return redirect("room")
+    errors = [
+        f"File size exceeds the limit of {MAX_UPLOAD_SIZE // 1048576}MB." if request_file.size > MAX_UPLOAD_SIZE else None
+        for request_file in request_files
+    ]
+    accepted = [index for index, error in enumerate(errors) if error is None]
+
+    stored_names = [None] * len(request_files)
+    for index, (name, exc) in zip(accepted, save_uploaded_files([request_files[i] for i in accepted])):
+        if exc is None:
+            stored_names[index] = name
+        else:
+            errors[index] = "File could not be stored."
+    stored = [name for name in stored_names if name is not None]
+    try:
+        File.objects.using(room._state.db).bulk_create(
+            [File(room=room, file=name, search_name=search_key(name)) for name in stored]
+        )
+    except Exception:
+        # Don't leave objects in the storage that no File row points to.
+        storage = File._meta.get_field("file").storage
+        for name in stored:
+            storage.delete(name)
+        raise
+
+    # "stored_name" is the name the file is listed and downloaded under, which differs from the
+    # uploaded name when a file with that name already exists.
+    results = [
+        {"name": request_file.name, "stored_name": stored_name, "uploaded": error is None, "error": error}
+        for request_file, stored_name, error in zip(request_files, stored_names, errors)
+    ]
+    if wants_json:
+        return JsonResponse({"files": results})
+    for result in results:
+        if not result["uploaded"]:
+            messages.error(request, f'{result["name"]}: {result["error"]}')
     return redirect("room")
 
 
@@ -284,7 +447,8 @@ def generate_presigned_url(object_name):
 @room_required
 def download_file(request, file_name):
     """
-    Download a file from the current room.
+    Download a file from the current room, through CloudFront when it is configured and straight from
+    S3 otherwise.
 
     Args:
         request (HttpRequest): The HTTP request.
@@ -294,14 +458,16 @@ def download_file(request, file_name):
         Union[HttpResponse, HttpResponseRedirect]: The HTTP response.
 
     """
-    try:
-        requested_file = File.objects.get(file=file_name)
-    except ObjectDoesNotExist:
+    room = find_room(request.session["rname"])
+    if room is None:
         request.session.flush()
         return HttpResponse('<h3 align="center" style="font-family:Open Sans">Room has been expired<h3>')
 
-    # validating if the user requesting the file is from the same room where the file is available
-    if requested_file.room.rname == request.session["rname"]:
+    # Only files of the user's own room can be downloaded.
+    if not room.file_set.filter(file=file_name).exists():
+        return HttpResponse("File not found")
+    if cloudfront_enabled():
+        link = generate_cloudfront_url(file_name)
+    else:
         link = generate_presigned_url(file_name)
-        return redirect(link)
-    return HttpResponse("File not found")
+    return redirect(link)